@@ -7,12 +7,15 @@ Photometry Control vs Test (portable GitHub-ready; paper-matched)
 - Photobleaching correction
 - Motion correction (405 -> 465 regression)
 - Z-score normalization using a global baseline interval
-- Saves per-animal processed CSVs and group mean±SEM SVG
+- Saves per-animal processed Parquet files (Snappy) and group mean±SEM SVG
+
+Requires: numpy, pandas, matplotlib, pyarrow
 
 Paper-matched note (important for reproducibility):
-- This script intentionally passes pandas Series into mean()/std() where appropriate,
-  so that std() uses pandas default ddof=1 (matching typical "paper-used" scripts).
-- Avoids .values for Z-score and photobleaching steps to prevent ddof=0 differences.
+- Z-score std() uses ddof=1 (pandas Series default, matching typical "paper-used" scripts).
+- ddof is passed explicitly, so Series and .values inputs give identical results.
+- Fluorescence traces are held as float32 (time stays float64) and all means/stds
+  accumulate in float64; Z-scores agree with an all-float64 run to ~1e-5.
 
 Default folder layout (recommended):
 repo/
@@ -30,10 +33,17 @@ Or specify folders:
 
 import os
 import glob
+import warnings
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.dataset as pads
 
 
 # -----------------------------
@@ -48,27 +58,47 @@ DEFAULT_PLOT_LOWER_SEC = 2700    # 45 min
 DEFAULT_PLOT_UPPER_SEC = 24300   # 6 h 45 min
 
 
+# Per-animal output columns appended to ['time','F-465','AF-405'], in file order
+PROCESSED_COLUMNS = ["fluo465-pbc", "fluo405-pbc", "fluo405-maf", "fluo465-mac", "fluo465-zsc"]
+
+
 # -----------------------------
 # Correction / normalization functions
 # -----------------------------
-def correct_photobleaching(ts, ys, pre_interval, post_interval):
+def _interval_slice(ts, interval):
+    """
+    Index slice of samples with interval[0] <= ts <= interval[1] (ts sorted ascending).
+    """
+    lo = np.searchsorted(ts, interval[0], side="left")
+    hi = np.searchsorted(ts, interval[1], side="right")
+    return slice(lo, max(lo, hi))
+
+
+def correct_photobleaching(ts, ys, pre_interval, post_interval, pre_slice=None, post_slice=None):
     """
     Linear photobleaching correction using means from two windows.
+    pre_slice/post_slice: window index slices already resolved on ts (see _interval_slice),
+    to share them across channels; resolved from the intervals when omitted.
 
     IMPORTANT:
     - Designed to behave like typical paper-used implementations using pandas Series.
     - No fallback paths that change outputs silently.
+    - ts must be sorted ascending (windows are resolved with searchsorted).
+    - Window means accumulate in float64; the result keeps the dtype of ys.
     """
-    pre_mask = (ts >= pre_interval[0]) & (ts <= pre_interval[1])
-    post_mask = (ts >= post_interval[0]) & (ts <= post_interval[1])
-    if pre_mask.sum() < 5 or post_mask.sum() < 5:
+    ts_arr = np.asarray(ts)
+    ys_arr = np.asarray(ys)
+    pre = _interval_slice(ts_arr, pre_interval) if pre_slice is None else pre_slice
+    post = _interval_slice(ts_arr, post_interval) if post_slice is None else post_slice
+    if pre.stop - pre.start < 5 or post.stop - post.start < 5:
         raise ValueError("Baseline intervals too short for photobleaching correction.")
 
-    pre_mean = ys[pre_mask].mean()
-    post_mean = ys[post_mask].mean()
+    pre_mean = ys_arr[pre].mean(dtype=np.float64)
+    post_mean = ys_arr[post].mean(dtype=np.float64)
     slope = (post_mean - pre_mean) / (post_interval[1] - pre_interval[0])
     intercept = pre_mean - slope * pre_interval[0]
-    return ys - (slope * ts + intercept)
+    trend = (slope * ts_arr + intercept).astype(ys_arr.dtype, copy=False)
+    return ys - trend
 
 
 def correct_motion(fluo465, fluo405):
@@ -76,15 +106,35 @@ def correct_motion(fluo465, fluo405):
     Motion correction by linear regression (405 fitted to 465).
 
     NOTE:
-    - Uses numpy lstsq; passing Series or ndarray yields equivalent results in practice.
+    - Closed-form least squares (slope = cov/var); same fit as lstsq on [405, 1].
+    - fitted - mean(fitted) == slope * (405 - mean(405)), so the intercept cancels.
+    - Sums accumulate in float64; the result keeps the dtype of the inputs.
+    - A constant 405 channel (dead/clipped) raises instead of yielding a NaN slope.
     """
     if len(fluo405) < 10:
         raise ValueError("Not enough data points for motion correction.")
-    A = np.vstack([np.asarray(fluo405), np.ones_like(np.asarray(fluo405))]).T
-    coeffs, _, _, _ = np.linalg.lstsq(A, np.asarray(fluo465), rcond=None)
-    fitted = A @ coeffs
-    corrected = np.asarray(fluo465) - (fitted - np.mean(fitted))
-    return np.asarray(fluo405), corrected
+    x = np.asarray(fluo405)
+    y = np.asarray(fluo465)
+    dx = x - float(x.mean(dtype=np.float64))
+    dy = y - float(y.mean(dtype=np.float64))
+    var = (dx * dx).sum(dtype=np.float64)
+    if var == 0:
+        raise ValueError("Cannot motion-correct (405 has zero variance).")
+    slope = float((dx * dy).sum(dtype=np.float64) / var)
+    corrected = y - slope * dx
+    return x, corrected
+
+
+def _mean_std_ddof1(a):
+    """
+    Mean and sample std (ddof=1) of a, accumulated in float64, as Python floats
+    (which keep float32 traces float32 in later arithmetic).
+    The mean is computed once and reused for the deviations, so the slice is read
+    twice; a.mean() followed by a.std() would take a third pass to redo the mean.
+    """
+    mean = a.mean(dtype=np.float64)
+    dev = a - mean
+    return float(mean), float(np.sqrt(np.dot(dev, dev) / (len(a) - 1)))
 
 
 def transform_to_zscore(ts, ys, baseline_interval=(0, 60)):
@@ -92,77 +142,216 @@ def transform_to_zscore(ts, ys, baseline_interval=(0, 60)):
     Z-score normalization using a global baseline interval.
 
     CRITICAL (paper-matched):
-    - If ys is a pandas Series, .std() uses ddof=1 by default (matching many paper scripts).
-    - To preserve that behavior, call this with pandas Series (not .values).
+    - std uses ddof=1 (pandas Series default, matching many paper scripts).
+    - ddof is explicit, so Series and ndarray inputs give the same result.
+    - ts must be sorted ascending (the window is resolved with searchsorted).
     """
-    mask = (ts >= baseline_interval[0]) & (ts <= baseline_interval[1])
-    if mask.sum() < 5:
+    ts_arr = np.asarray(ts)
+    ys_arr = np.asarray(ys)
+    base = _interval_slice(ts_arr, baseline_interval)
+    if base.stop - base.start < 5:
         raise ValueError("Baseline interval too short for Z-score.")
 
-    mu = ys[mask].mean()
-    sd = ys[mask].std()  # pandas default ddof=1 when ys is Series
+    mu, sd = _mean_std_ddof1(ys_arr[base])  # paper-matched ddof=1
     if sd == 0:
         raise ValueError("Cannot Z-score (std=0).")
     return (ys - mu) / sd
 
 
+def process_trace(ts, fluo465, fluo405, pre_interval, post_interval, baseline_interval):
+    """
+    Runs the per-animal chain in one call: photobleaching correction of both
+    channels, motion correction (405 -> 465) and Z-score of the corrected 465.
+
+    Pass ndarrays (e.g. Series.to_numpy()): every step then stays on plain arrays
+    and no intermediate Series is built.
+    Returns one (len(ts), 5) array whose columns are PROCESSED_COLUMNS.
+    Raises ValueError from whichever step cannot be applied.
+    """
+    # both channels share the time vector: resolve the photobleaching windows once
+    ts = np.asarray(ts)
+    pre = _interval_slice(ts, pre_interval)
+    post = _interval_slice(ts, post_interval)
+
+    # one row per output channel (contiguous writes); returned transposed as time x channel
+    out = np.empty((len(PROCESSED_COLUMNS), len(ts)), dtype=np.result_type(fluo465, fluo405))
+    out[0] = correct_photobleaching(ts, fluo465, pre_interval, post_interval, pre, post)
+    out[1] = correct_photobleaching(ts, fluo405, pre_interval, post_interval, pre, post)
+    out[2], out[3] = correct_motion(out[0], out[1])
+    out[4] = transform_to_zscore(ts, out[3], baseline_interval=baseline_interval)
+    return out.T
+
+
 # -----------------------------
 # IO helpers
 # -----------------------------
 def detect_header_line(filepath, max_lines=20):
     """
     Attempts to find the header line containing 'Time' and either 'gfp' or 'tomato' keywords.
+    Only the first max_lines lines are read.
     """
     with open(filepath, "r", encoding="utf-8", errors="ignore") as f:
-        for i, line in enumerate(f.readlines()[:max_lines]):
+        for i, line in enumerate(islice(f, max_lines)):
             low = line.lower()
             if ("time" in low) and (("gfp" in low) or ("tomato" in low)):
                 return i
     return None
 
 
-def load_and_standardize_csv(filepath):
+def map_columns(columns):
     """
-    Loads CSV and maps columns to: time, F-465 (GFP), AF-405 (tdTomato)
-    Returns standardized df with columns ['time','F-465','AF-405'].
+    Maps raw column names to standard names by keyword: time, F-465 (GFP), AF-405 (tdTomato).
+    Returns {raw_name: standard_name} for the matched columns only.
     """
-    header_line = detect_header_line(filepath)
-    if header_line is None:
-        raise ValueError("Header line not detected (missing Time/GFP/Tomato keywords).")
-
-    df = pd.read_csv(filepath, skiprows=header_line, low_memory=False)
-    df.columns = [c.strip() for c in df.columns]
-
     col_map = {}
-    for col in df.columns:
-        low = col.lower()
+    for col in columns:
+        low = col.strip().lower()
         if "time" in low:
             col_map[col] = "time"
         elif "gfp" in low:
             col_map[col] = "F-465"
         elif "tomato" in low:
             col_map[col] = "AF-405"
+    return col_map
 
-    df = df.rename(columns=col_map)
+
+def read_raw_csv(filepath, header_line, usecols=None, dtype=None):
+    """
+    Reads the CSV table starting at header_line (0-based line index).
+    usecols/dtype (raw column names) restrict and type the parsed columns.
+
+    Uses pyarrow's multithreaded CSV reader.
+    The preamble is skipped by raw line count on the open file, because pyarrow's
+    skip_rows does not count blank lines the way detect_header_line does.
+    Rows with the wrong field count (e.g. a last line cut off mid-write) are skipped,
+    as pandas' NaN-fill + dropna() dropped them.
+    """
+    parse_options = pacsv.ParseOptions(invalid_row_handler=lambda row: "skip")
+    convert_options = pacsv.ConvertOptions(
+        include_columns=list(usecols or []),
+        column_types={c: pa.from_numpy_dtype(np.dtype(t)) for c, t in (dtype or {}).items()},
+    )
+    with open(filepath, "rb") as f:
+        for _ in range(header_line):
+            f.readline()
+        table = pacsv.read_csv(f, read_options=pacsv.ReadOptions(use_threads=True),
+                               parse_options=parse_options,
+                               convert_options=convert_options)
+    return table.to_pandas()
+
+
+def load_and_standardize_csv(filepath):
+    """
+    Loads CSV and maps columns to: time, F-465 (GFP), AF-405 (tdTomato)
+    Returns standardized df with columns ['time','F-465','AF-405'].
+
+    Only the mapped columns are parsed, with fixed dtypes: time as float64 so window
+    bounds and the photobleaching trend keep sub-ms resolution, and the fluorescence
+    traces as float32 to halve their memory.
+    """
+    header_line = detect_header_line(filepath)
+    if header_line is None:
+        raise ValueError("Header line not detected (missing Time/GFP/Tomato keywords).")
+
+    header = pd.read_csv(filepath, skiprows=header_line, nrows=0).columns
+    col_map = map_columns(header)
 
     required = ["time", "F-465", "AF-405"]
-    missing = [c for c in required if c not in df.columns]
+    missing = [c for c in required if c not in col_map.values()]
     if missing:
         raise ValueError(f"Required columns missing: {missing}")
 
+    dtype = {src: (np.float64 if std == "time" else np.float32) for src, std in col_map.items()}
+    df = read_raw_csv(filepath, header_line, usecols=list(col_map), dtype=dtype)
+    df = df.rename(columns=col_map)
+
     df = df[required].dropna()
+    if not df["time"].is_monotonic_increasing:
+        raise ValueError("Time column is not monotonically increasing.")
     return df
 
 
 # -----------------------------
 # ① Per-animal processing
 # -----------------------------
+def _process_one(fpath, output_folder,
+                 baseline_interval_global,
+                 baseline_pre_interval,
+                 baseline_post_start_offset,
+                 baseline_post_end_offset,
+                 nan_ratio_threshold):
+    """
+    Processes one raw CSV and saves its '*-phmtry.parquet'. Returns True if saved.
+    Runs in a worker process, so it reports via print() and never raises.
+    """
+    fname = os.path.basename(fpath)
+    print(f"\n📌 Processing: {fname}")
+
+    try:
+        df = load_and_standardize_csv(fpath)
+    except Exception as e:
+        print(f"⚠ Load/header error -> skip: {fname}: {e}")
+        return False
+
+    if df.empty or len(df) < 10:
+        print(f"⚠ Too few rows -> skip: {fname}")
+        return False
+
+    max_time = df["time"].max()
+    pre_interval = baseline_pre_interval
+    post_interval = (max_time - baseline_post_start_offset, max_time - baseline_post_end_offset)
+
+    # Photobleaching -> motion correction -> Z-score (paper-matched ddof=1)
+    try:
+        processed = process_trace(df["time"].to_numpy(),
+                                  df["F-465"].to_numpy(),
+                                  df["AF-405"].to_numpy(),
+                                  pre_interval, post_interval,
+                                  baseline_interval_global)
+    except Exception as e:
+        print(f"⚠ Processing failed -> skip: {fname}: {e}")
+        return False
+
+    nan_ratio = np.isnan(processed[:, :2]).mean()  # fluo465-pbc, fluo405-pbc
+    if nan_ratio > nan_ratio_threshold:
+        print(f"⚠ Too many NaNs after photobleaching correction ({nan_ratio:.2%}) -> skip: {fname}")
+        return False
+
+    # build the output frame once instead of growing df column by column
+    df = pd.concat([df.reset_index(drop=True),
+                    pd.DataFrame(processed, columns=PROCESSED_COLUMNS, copy=False)], axis=1)
+
+    animal_name = os.path.splitext(fname)[0]
+    out_path = os.path.join(output_folder, f"{animal_name}-phmtry.parquet")
+    try:
+        df.to_parquet(out_path, engine="pyarrow", compression="snappy", index=False)
+    except Exception as e:
+        print(f"⚠ Save failed -> skip: {fname}: {e}")
+        return False
+    print(f"✅ Saved: {out_path}")
+    return True
+
+
+def _init_worker():
+    """
+    Pool worker initializer: one arrow CPU thread per process, so N worker processes
+    do not each start an N-thread CSV reader (~N^2 threads on N cores).
+    """
+    pa.set_cpu_count(1)
+
+
 def process_folder(input_folder, output_folder,
                    baseline_interval_global,
                    baseline_pre_interval,
                    baseline_post_start_offset,
                    baseline_post_end_offset,
-                   nan_ratio_threshold=0.2):
+                   nan_ratio_threshold=0.2,
+                   max_workers=None):
+    """
+    Processes every raw CSV in input_folder; animals run in parallel worker
+    processes (max_workers=None -> os.cpu_count(), 1 -> serial in this process).
+    Returns the number of files saved.
+    """
     files = glob.glob(os.path.join(input_folder, "*.csv"))
     if not files:
         print(f"⚠ No CSV files found: {input_folder}")
@@ -170,134 +359,179 @@ def process_folder(input_folder, output_folder,
 
     os.makedirs(output_folder, exist_ok=True)
 
-    n_saved = 0
-    for fpath in files:
-        fname = os.path.basename(fpath)
-        print(f"\n📌 Processing: {fname}")
+    worker = partial(_process_one,
+                     output_folder=output_folder,
+                     baseline_interval_global=baseline_interval_global,
+                     baseline_pre_interval=baseline_pre_interval,
+                     baseline_post_start_offset=baseline_post_start_offset,
+                     baseline_post_end_offset=baseline_post_end_offset,
+                     nan_ratio_threshold=nan_ratio_threshold)
 
-        try:
-            df = load_and_standardize_csv(fpath)
-        except Exception as e:
-            print(f"⚠ Load/header error -> skip: {e}")
-            continue
+    if max_workers == 1 or len(files) == 1:
+        results = [worker(fpath) for fpath in files]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker) as ex:
+            results = list(ex.map(worker, files))
 
-        if df.empty or len(df) < 10:
-            print("⚠ Too few rows -> skip")
-            continue
+    return sum(results)
 
-        max_time = df["time"].max()
-        pre_interval = baseline_pre_interval
-        post_interval = (max_time - baseline_post_start_offset, max_time - baseline_post_end_offset)
 
-        # Photobleaching correction (paper-matched: pass Series, not .values)
-        try:
-            df["fluo465-pbc"] = correct_photobleaching(df["time"], df["F-465"], pre_interval, post_interval)
-            df["fluo405-pbc"] = correct_photobleaching(df["time"], df["AF-405"], pre_interval, post_interval)
-        except Exception as e:
-            print(f"⚠ Photobleaching correction failed -> skip: {e}")
-            continue
-
-        nan_ratio = df[["fluo465-pbc", "fluo405-pbc"]].isna().mean().mean()
-        if nan_ratio > nan_ratio_threshold:
-            print(f"⚠ Too many NaNs after photobleaching correction ({nan_ratio:.2%}) -> skip")
-            continue
+# -----------------------------
+# ② Group mean±SEM plot
+# -----------------------------
+def _resample_to_grid(t_grid, ts, ys, max_gap_sec=0.5):
+    """
+    Linearly interpolates ys(ts) onto t_grid (ts sorted ascending).
+    Grid points outside [ts[0], ts[-1]] or farther than max_gap_sec from the nearest
+    sample (dropped rows, signal dropouts) are NaN instead of being bridged.
+    The default, half the 1 s grid step, is the old binning's "bin has no sample" rule.
+    """
+    out = np.interp(t_grid, ts, ys, left=np.nan, right=np.nan)
+    idx = np.searchsorted(ts, t_grid)
+    prev_gap = t_grid - ts[np.clip(idx - 1, 0, len(ts) - 1)]
+    next_gap = ts[np.clip(idx, 0, len(ts) - 1)] - t_grid
+    nearest = np.minimum(np.abs(prev_gap), np.abs(next_gap))
+    out[nearest > max_gap_sec] = np.nan
+    return out
 
-        # Motion correction
-        try:
-            fluo405_maf, fluo465_mac = correct_motion(df["fluo465-pbc"], df["fluo405-pbc"])
-            # Store as Series aligned to df index
-            df["fluo405-maf"] = pd.Series(fluo405_maf, index=df.index)
-            df["fluo465-mac"] = pd.Series(fluo465_mac, index=df.index)
-        except Exception as e:
-            print(f"⚠ Motion correction failed -> skip: {e}")
-            continue
 
-        # Z-score (paper-matched: pass Series, not .values; preserves ddof=1 behavior)
+def _scan_group_traces(files, plot_lower_sec, plot_upper_sec):
+    """
+    Reads time/fluo465-zsc from all processed files in one pyarrow dataset scan,
+    with the column projection and plot-window filter pushed into the reader.
+    Returns {fpath: (ts, ys)} for every file (empty arrays if no rows in the window).
+    """
+    dataset = pads.dataset(files, format="parquet")
+    # __filename holds the dataset's normalized paths (e.g. '/' on Windows), not the glob
+    # strings: map them back through dataset.files, which keeps the input order
+    if len(dataset.files) != len(files):
+        raise ValueError("dataset file list does not match the processed files")
+    path_of = dict(zip(dataset.files, files))
+    window = (pads.field("time") >= plot_lower_sec) & (pads.field("time") <= plot_upper_sec)
+    table = dataset.to_table(columns=["__filename", "time", "fluo465-zsc"], filter=window)
+    traces = {fpath: (np.empty(0), np.empty(0)) for fpath in files}
+    if table.num_rows == 0:
+        return traces  # nothing in the plot window for any file
+    # scan order across files is not guaranteed: regroup each file's rows in time order
+    table = table.sort_by([("__filename", "ascending"), ("time", "ascending")])
+
+    names = table.column("__filename").to_numpy(zero_copy_only=False)
+    ts = table.column("time").to_numpy()
+    ys = table.column("fluo465-zsc").to_numpy()
+    bounds = np.concatenate(([0], np.flatnonzero(names[1:] != names[:-1]) + 1, [len(names)]))
+    traces.update({path_of[names[lo]]: (ts[lo:hi], ys[lo:hi])
+                   for lo, hi in zip(bounds[:-1], bounds[1:])})
+    return traces
+
+
+def _read_group_traces(files, plot_lower_sec, plot_upper_sec):
+    """
+    Per-file fallback for _scan_group_traces: one pandas read per processed file,
+    skipping unreadable files. Returns {fpath: (ts, ys)} within the plot window.
+    """
+    traces = {}
+    for fpath in files:
         try:
-            df["fluo465-zsc"] = transform_to_zscore(df["time"], df["fluo465-mac"],
-                                                   baseline_interval=baseline_interval_global)
+            df = pd.read_parquet(fpath, columns=["time", "fluo465-zsc"])
         except Exception as e:
-            print(f"⚠ Z-score failed -> skip: {e}")
+            print(f"⚠ Read processed file failed -> skip: {fpath} ({e})")
             continue
 
-        animal_name = os.path.splitext(fname)[0]
-        out_csv = os.path.join(output_folder, f"{animal_name}-phmtry.csv")
-        df.to_csv(out_csv, index=False)
-        print(f"✅ Saved: {out_csv}")
-        n_saved += 1
-
-    return n_saved
+        ts = df["time"].to_numpy()
+        window = _interval_slice(ts, (plot_lower_sec, plot_upper_sec))
+        traces[fpath] = (ts[window], df["fluo465-zsc"].to_numpy()[window])
+    return traces
 
 
-# -----------------------------
-# ② Group mean±SEM plot
-# -----------------------------
 def load_group_data(folder, plot_lower_sec, plot_upper_sec):
-    files = glob.glob(os.path.join(folder, "*-phmtry.csv"))
+    """
+    Loads one group's processed files and resamples each animal onto a shared
+    1-second grid over the plot window (linear interpolation).
+    Returns (times, values): int seconds and a float32 (time x animal) matrix, NaN where
+    an animal has no data.
+    """
+    files = glob.glob(os.path.join(folder, "*-phmtry.parquet"))
     if not files:
-        raise ValueError(f"No processed '*-phmtry.csv' files found: {folder}")
+        raise ValueError(f"No processed '*-phmtry.parquet' files found: {folder}")
 
-    all_df = []
-    for fpath in files:
-        try:
-            df = pd.read_csv(fpath, usecols=["time", "fluo465-zsc"])
-        except Exception as e:
-            print(f"⚠ Read processed CSV failed -> skip: {fpath} ({e})")
-            continue
+    try:
+        traces = _scan_group_traces(files, plot_lower_sec, plot_upper_sec)
+    except Exception as e:
+        # e.g. one corrupt file aborts the whole scan: retry file by file, skipping bad ones
+        print(f"⚠ Dataset scan failed -> reading files one by one ({e})")
+        traces = _read_group_traces(files, plot_lower_sec, plot_upper_sec)
 
-        upper_limit = min(plot_upper_sec, df["time"].max())
-        df = df[(df["time"] >= plot_lower_sec) & (df["time"] <= upper_limit)]
-        if df.empty or len(df) < 10:
+    t_grid = np.arange(np.ceil(plot_lower_sec), np.floor(plot_upper_sec) + 1)
+
+    columns = []
+    for fpath in files:
+        if fpath not in traces:
+            continue  # unreadable; already reported by _read_group_traces
+        ts, ys = traces[fpath]
+        if len(ts) < 10:
             print(f"⚠ Not enough data in plot window -> skip: {os.path.basename(fpath)}")
             continue
 
-        # bin to 1-second and average
-        df["time"] = df["time"].round().astype(int)
-        df = df.groupby("time", as_index=False).mean(numeric_only=True)
-
-        animal_name = os.path.basename(fpath).split("-")[0]
-        df = df.rename(columns={"fluo465-zsc": animal_name})
-        all_df.append(df)
+        # resample to 1 s; NaN outside this animal's samples and inside data gaps
+        columns.append(_resample_to_grid(t_grid, ts, ys))
 
-    if not all_df:
+    if not columns:
         raise ValueError(f"No valid processed files in folder: {folder}")
 
-    merged = all_df[0]
-    for d in all_df[1:]:
-        merged = pd.merge(merged, d, on="time", how="outer")
+    # identical grid for every animal -> columns stack directly (time x animal)
+    values = np.column_stack(columns).astype(np.float32)
+    # trim only leading/trailing grid points no animal covers; interior all-NaN rows
+    # (shared dropouts) stay so the plotted lines break there instead of bridging
+    covered = np.flatnonzero(~np.isnan(values).all(axis=1))
+    keep = slice(covered[0], covered[-1] + 1) if covered.size else slice(0, 0)
+    return t_grid[keep].astype(np.int64), values[keep]
 
-    merged = merged.drop_duplicates(subset=["time"]).sort_values("time").reset_index(drop=True)
-    return merged
+
+def _group_mean_sem(vals):
+    """
+    Per-timepoint mean and SEM across animals (columns), ignoring NaNs.
+    SEM = std(ddof=1) / sqrt(n) with n = animals present at that timepoint;
+    it is NaN where fewer than two animals contribute.
+    """
+    n = np.sum(~np.isnan(vals), axis=1)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN rows / n < 2
+        mean = np.nanmean(vals, axis=1)
+        sem = np.nanstd(vals, axis=1, ddof=1) / np.sqrt(n)
+    return mean, sem
 
 
 def plot_control_vs_test(control_data, test_data, out_svg):
-    control_times = control_data["time"].values
-    control_vals = control_data.drop(columns=["time"]).values
-    control_mean = np.nanmean(control_vals, axis=1)
-    control_sem = np.nanstd(control_vals, axis=1) / np.sqrt(control_vals.shape[1])
+    """
+    control_data / test_data: (times, values) tuples from load_group_data().
+    """
+    control_times, control_vals = control_data
+    control_mean, control_sem = _group_mean_sem(control_vals)
 
-    test_times = test_data["time"].values
-    test_vals = test_data.drop(columns=["time"]).values
-    test_mean = np.nanmean(test_vals, axis=1)
-    test_sem = np.nanstd(test_vals, axis=1) / np.sqrt(test_vals.shape[1])
+    test_times, test_vals = test_data
+    test_mean, test_sem = _group_mean_sem(test_vals)
 
     os.makedirs(os.path.dirname(out_svg), exist_ok=True)
 
-    plt.figure(figsize=(12, 6))
-    plt.title("Z-score Mean ± SEM (Control vs Test)", fontsize=14)
-    plt.xlabel("Time (s)", fontsize=12)
-    plt.ylabel("Z-score", fontsize=12)
+    fig, ax = plt.subplots(figsize=(12, 6))
+    ax.set_title("Z-score Mean ± SEM (Control vs Test)", fontsize=14)
+    ax.set_xlabel("Time (s)", fontsize=12)
+    ax.set_ylabel("Z-score", fontsize=12)
 
-    plt.plot(control_times, control_mean, label="Control", lw=2)
-    plt.fill_between(control_times, control_mean - control_sem, control_mean + control_sem, alpha=0.3)
+    # SEM bands are embedded as bitmaps (rasterized) to keep the SVG small;
+    # the mean traces, axes and text stay vector.
+    ax.plot(control_times, control_mean, label="Control", lw=2)
+    ax.fill_between(control_times, control_mean - control_sem, control_mean + control_sem,
+                    alpha=0.3, rasterized=True)
 
-    plt.plot(test_times, test_mean, label="Test", lw=2)
-    plt.fill_between(test_times, test_mean - test_sem, test_mean + test_sem, alpha=0.3)
+    ax.plot(test_times, test_mean, label="Test", lw=2)
+    ax.fill_between(test_times, test_mean - test_sem, test_mean + test_sem,
+                    alpha=0.3, rasterized=True)
 
-    plt.legend()
-    plt.tight_layout()
-    plt.savefig(out_svg, format="svg")
-    plt.close()
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(out_svg, format="svg", dpi=150)  # dpi sets the rasterized band resolution
+    plt.close(fig)
 
 
 # -----------------------------
@@ -325,6 +559,9 @@ def main():
     parser.add_argument("--plot_lower", type=float, default=DEFAULT_PLOT_LOWER_SEC)
     parser.add_argument("--plot_upper", type=float, default=DEFAULT_PLOT_UPPER_SEC)
 
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="Worker processes for per-animal processing (default: all CPUs; 1 = serial)")
+
     args = parser.parse_args()
 
     control_out_dir = os.path.join(args.out, "Control")
@@ -345,6 +582,7 @@ def main():
         baseline_pre_interval=baseline_pre_interval,
         baseline_post_start_offset=args.post_start_offset,
         baseline_post_end_offset=args.post_end_offset,
+        max_workers=args.jobs,
     )
 
     print("\n=== Test group processing ===")
@@ -355,6 +593,7 @@ def main():
         baseline_pre_interval=baseline_pre_interval,
         baseline_post_start_offset=args.post_start_offset,
         baseline_post_end_offset=args.post_end_offset,
+        max_workers=args.jobs,
     )
 
     if n_control == 0 or n_test == 0: